@@ -21,6 +21,7 @@ import shutil
 import simplekml
 import os
 import subprocess
+import multiprocessing
 # import xml.etree.ElementTree as ET
 from textwrap import dedent
 
@@ -115,6 +116,24 @@ def make_names(clear_name):
     gpi_name            = clear_name+"-Dealer.gpi"                            # type: ignore                                         
     return(kml_name,kml_oroux, kml_organic,gpx_name,gpi_name)
 
+# ------------------------------------------------------------------------------------------
+#   ____                _           _      ____ ______  __
+#  / ___|   _ _ __ __ _| |_ ___  __| |    / ___|  _ \ \/ /
+# | |  | | | | '__/ _` | __/ _ \/ _` |   | |  _| |_) \  / 
+# | |__| |_| | | | (_| | ||  __/ (_| |   | |_| |  __//  \ 
+#  \____\__,_|_|  \__,_|\__\___|\__,_|___\____|_|  /_/\_\
+#                                   |_____|              
+# ------------------------------------------------------------------------------------------
+def curated_waypoints(brand_or_name):
+    '''
+    Hand-curated dealer GPX files live next to the exe in GPX_Dealer\<brand>\*.gpx
+    Return their merged waypoints, or None if there are none for this brand.
+    '''
+    gpx_dir = os.path.join(str(h_utils.IchSelbst().path), "GPX_Dealer", brand_or_name)
+    if len(h_utils.find_gpx_files(gpx_dir)) == 0:
+        return None
+    return h_utils.mein_gpx.batch(gpx_dir)
+
 # ------------------------------------------------------------------------------------------
 #  __  __       _        __        __                      _       _       
 # |  \/  | __ _| | _____ \ \      / /_ _ _   _ _ __   ___ (_)_ __ | |_ ___ 
@@ -144,11 +163,58 @@ def make_waypoints(data):
         else:
             name = "NoName"
         if name != "NoName":
-            new_waypoint = {"name": name, "description": descript, "lat": lat, "lon": lon}
+            new_waypoint = {"name": name, "description": descript, "lat": lat, "lon": lon, "osm_id": element['type'] + '/' + str(element['id'])}
             # print(new_waypoint)
             coords.append(new_waypoint)
     return(coords)
 
+# ------------------------------------------------------------------------------------------
+#  _  ____  __ _         ___    _     
+# | |/ /  \/  | |       |_ _|__| |___ 
+# | ' /| |\/| | |        | |/ _` / __|
+# | . \| |  | | |___     | | (_| \__ \
+# |_|\_\_|  |_|_____|___|___\__,_|___/
+#                  |_____|            
+# ------------------------------------------------------------------------------------------
+# simplekml has no public way to set ids. The helpers below use its internals
+# (Kmlable._globalid and the _id of Placemark, Point, Style, IconStyle, Icon).
+# Tested with simplekml 1.3.6 - check the byte-stable output again after an upgrade.
+# ------------------------------------------------------------------------------------------
+def kml_id(waypoint):
+    ''' Stable Placemark id from the OSM type/id, e.g. node/123 -> node_123. Without one: hash of name and position. '''
+    if "osm_id" in waypoint:
+        key = waypoint["osm_id"]
+    else:
+        key = h_utils.waypoint_key(waypoint["name"], waypoint["lat"], waypoint["lon"])
+    return key.replace('/', '_')
+
+def new_kml(brand_or_name):
+    '''
+    simplekml numbers Document, Style, Icon ... with one counter for the whole process.
+    Reset it per file, otherwise one more BMW dealer changes every id in all later brands.
+    '''
+    assert hasattr(simplekml.base.Kmlable, "_globalid"), "simplekml internals changed - KML ids would no longer be stable"
+    simplekml.base.Kmlable._globalid = 0
+    return simplekml.Kml(name="<![CDATA["+brand_or_name+"]]>", visibility = "1" , open ="1", atomauthor = "Hans Straßgütl" , atomlink = "https://gravelmaps.de"  )
+
+def new_kml_point(kml, element):
+    ''' Placemark and Point get ids from the waypoint's stable key instead of the counter. '''
+    pt2 = kml.newpoint(name='<![CDATA[' + element["name"] + ']]>',coords=[(element["lon"], element["lat"])], description = element["description"] )
+    assert hasattr(pt2.placemark, "_id") and hasattr(pt2, "_id"), "simplekml internals changed - KML ids would no longer be stable"
+    pt2.placemark._id = kml_id(element)
+    pt2._id = kml_id(element) + "_pt"
+    return pt2
+
+def new_orux_style(orux_icon):
+    ''' One shared icon style for all OruxMaps points, with fixed ids. '''
+    orux_style = simplekml.Style()
+    assert hasattr(orux_style, "_id") and hasattr(orux_style.iconstyle, "_id") and hasattr(orux_style.iconstyle.icon, "_id"), "simplekml internals changed - KML ids would no longer be stable"
+    orux_style._id = "orux_icon"
+    orux_style.iconstyle._id = "orux_iconstyle"
+    orux_style.iconstyle.icon._id = "orux_icon_href"
+    orux_style.iconstyle.icon.href = orux_icon
+    return orux_style
+
 # ------------------------------------------------------------------------------------------
 #  __  __       _            ____ ______  __    ____ ____ ___ 
 # |  \/  | __ _| | _____    / ___|  _ \ \/ /   / ___|  _ \_ _|
@@ -157,7 +223,10 @@ def make_waypoints(data):
 # |_|  |_|\__,_|_|\_\___|___\____|_|  /_/\_\___\____|_|  |___|
 #                      |_____|            |_____|             
 # ------------------------------------------------------------------------------------------
-def make_gpx_gpi(brand_or_name, garmin_icon, organic_color):
+def make_gpx_gpi(brand_or_name, garmin_icon, organic_color, gpx_waypoints=None):
+    '''
+    gpx_waypoints: optional list of waypoints (e.g. from h_utils.mein_gpx.batch) merged into the Overpass result.
+    '''
 
     overpass_query = "" 
 
@@ -209,8 +278,11 @@ def make_gpx_gpi(brand_or_name, garmin_icon, organic_color):
     # .......................................................................
     # convert to GeoDataFrame
     # .......................................................................
-    # Collect coords into list
+    # Collect coords into list. Hilbert order + OSM id keep the output byte-stable for unchanged dealers.
     coords = make_waypoints(data)
+    if gpx_waypoints:
+        coords = coords + gpx_waypoints
+    coords = h_utils.sort_hilbert(coords)
     # Some basic definitions
     kml_name, kml_orux_name, kml_organic_name, gpx_name, gpi_name = make_names(brand_or_name)
     my_path_to_icon = "http://motorradtouren.de/pins/bmp_4_oruxmaps/"
@@ -240,17 +312,18 @@ def make_gpx_gpi(brand_or_name, garmin_icon, organic_color):
     # Convert GeoDataFrame to KML using simplekml
     # ----------------------------------------------------------------            
     # In a first run, create a standard KML with no icons
-    kml = simplekml.Kml(name="<![CDATA["+brand_or_name+"]]>", visibility = "1" , open ="1", atomauthor = "Hans Straßgütl" , atomlink = "https://gravelmaps.de"  )  
+    kml = new_kml(brand_or_name)
     for element in coords:
-        pt2 = kml.newpoint(name='<![CDATA[' + element["name"] + ']]>',coords=[(element["lon"], element["lat"])], description = element["description"] )
+        new_kml_point(kml, element)
     kml.save(kml_name)                                                      # Now the standard KML is saved.
     shutil.copy2(kml_name, kml_organic_name)                                # Making sure that the standard KML isn't touched while reworking for Organic Maps
 
     # next step: create a KML with icons to be used with oruxmaps
-    kml = simplekml.Kml(name="<![CDATA["+brand_or_name+"]]>", visibility = "1" , open ="1", atomauthor = "Hans Straßgütl" , atomlink = "https://gravelmaps.de"  )  
+    kml = new_kml(brand_or_name)
+    orux_style = new_orux_style(orux_icon)                                  # One shared style instead of one per point
     for element in coords:
-        pt2 = kml.newpoint(name='<![CDATA[' + element["name"] + ']]>',coords=[(element["lon"], element["lat"])], description = element["description"] )
-        pt2.style.iconstyle.icon.href = orux_icon
+        pt2 = new_kml_point(kml, element)
+        pt2.style = orux_style
     kml.save(kml_orux_name)                                                 # Now the OruxMaps KML is saved.
 
     rework_kml_for_organic(kml_organic_name, organic_color)                
@@ -285,6 +358,7 @@ def make_gpx_gpi(brand_or_name, garmin_icon, organic_color):
 # |_|  |_|\__,_|_|_| |_|
 # ------------------------------------------------------------------------------------------
 if __name__ == "__main__":
+    multiprocessing.freeze_support()                                        # Needed for the ProcessPool in h_utils inside the pyinstaller exe
     os.system('cls') 
     # ....................................................
     # Erhalte die Übergabeparameter. Erstelle dazu den 
@@ -309,12 +383,12 @@ if __name__ == "__main__":
     # Build of overpass query for GasGas
     # .......................................................................
     # Define the variable
-    make_gpx_gpi("BMW","ATV","placemark-orange")
-    make_gpx_gpi("CFMOTO","ATV","placemark-orange")
-    make_gpx_gpi("GasGas","ATV","placemark-orange")
-    make_gpx_gpi("Honda","ATV","placemark-orange")
-    make_gpx_gpi("Husqvarna","ATV","placemark-orange")
-    make_gpx_gpi("KTM","ATV","placemark-orange")
-    make_gpx_gpi("Suzuki","ATV","placemark-orange")
-    make_gpx_gpi("Yamaha","ATV","placemark-orange")
-    make_gpx_gpi("GENERIC","ATV","placemark-orange")
\ No newline at end of file
+    make_gpx_gpi("BMW","ATV","placemark-orange", curated_waypoints("BMW"))
+    make_gpx_gpi("CFMOTO","ATV","placemark-orange", curated_waypoints("CFMOTO"))
+    make_gpx_gpi("GasGas","ATV","placemark-orange", curated_waypoints("GasGas"))
+    make_gpx_gpi("Honda","ATV","placemark-orange", curated_waypoints("Honda"))
+    make_gpx_gpi("Husqvarna","ATV","placemark-orange", curated_waypoints("Husqvarna"))
+    make_gpx_gpi("KTM","ATV","placemark-orange", curated_waypoints("KTM"))
+    make_gpx_gpi("Suzuki","ATV","placemark-orange", curated_waypoints("Suzuki"))
+    make_gpx_gpi("Yamaha","ATV","placemark-orange", curated_waypoints("Yamaha"))
+    make_gpx_gpi("GENERIC","ATV","placemark-orange", curated_waypoints("GENERIC"))
\ No newline at end of file
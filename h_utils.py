@@ -1,5 +1,8 @@
 
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import hashlib
 import json
 import gpxpy
 import os
@@ -58,6 +61,8 @@ def error_message(error, quit):
         ttk.Label(mainframe, text="There is a mix of standard GPX and Garmin GPX in this file. That doen't work. Fix it.").grid(column=1, row=1, sticky=W)
     if error == "gpx_04":
         ttk.Label(mainframe, text="There is no such GPX file!\nUse drag & drop.").grid(column=1, row=1, sticky=W)
+    if error == "gpx_05":
+        ttk.Label(mainframe, text="At least one GPX file couldn't be read and was skipped.\nSee the console for the file name.").grid(column=1, row=1, sticky=W)
 
     # .............................................................
     # Paramater passing Errors
@@ -298,6 +303,43 @@ def create_gpx_with_symbols(points, output_file, symbol):
     tree = ET.ElementTree(gpx)
     tree.write(output_file, encoding="utf-8", xml_declaration=True)
 
+# ------------------------------------------------------------------------------------------
+#  _   _ _ _ _               _     ___          _           
+# | | | (_) | |__   ___ _ __| |_  / _ \ _ __ __| | ___ _ __ 
+# | |_| | | | '_ \ / _ \ '__| __|| | | | '__/ _` |/ _ \ '__|
+# |  _  | | | |_) |  __/ |  | |_ | |_| | | | (_| |  __/ |   
+# |_| |_|_|_|_.__/ \___|_|   \__|_\___/|_|  \__,_|\___|_|   
+#                              |_____|                      
+# ------------------------------------------------------------------------------------------
+def hilbert_index(lat, lon, order=16):
+    '''
+    Position of lat/lon on a Hilbert curve over the whole world (2^order x 2^order grid).
+    Points close on the curve are close on the map.
+    '''
+    n = 1 << order
+    x = min(int((lon + 180.0) / 360.0 * n), n - 1)
+    y = min(int((lat + 90.0) / 180.0 * n), n - 1)
+    d = 0
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:                                                         # rotate the quadrant
+            if rx == 1:
+                x = n - 1 - x
+                y = n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return d
+
+def sort_hilbert(points):
+    '''
+    Sort waypoints (dict with 'lat', 'lon') in Hilbert curve order.
+    Same cell: the stable 'osm_id' (or the name) decides, so unchanged dealers always give the same output.
+    '''
+    return sorted(points, key=lambda p: (hilbert_index(p["lat"], p["lon"]), p.get("osm_id", ""), p["name"]))
+
 # ------------------------------------------------------------------------------------------
 #   ____                      _         ___           _                  
 #  / ___| __ _ _ __ _ __ ___ (_)_ __   |_ _|_ __  ___| |_ __ _ _ __  ____
@@ -326,7 +368,132 @@ class mein_gpx:
         self.gpx_name_without_suffix        = Path(SysArg0).stem                    # Nur der DateiName OHNE Suffix
         self.gpx_path_name_without_suffix   = Path(SysArg0).parent                  # Das ist der Path ohne trailing \
         self.gpx_path_with_name_no_suffix   = str(Path(SysArg0).parent) + "\\" + Path(SysArg0).stem #  Der Pfad mit Dateinamen aber ohne den Suffix
-        
+
+    @staticmethod
+    def batch(gpx_dir_or_glob, cache_file_name=None):
+        '''
+        Input:  Ein Verzeichnis (alle *.gpx darin) oder ein Glob wie "C:\\Dealer\\*.gpx".
+                Optional der Name der Cache Datei. Mit None liegt sie neben dem Script.
+        Output: Liste der Waypoints aller GPX, dedupliziert, im Format von make_waypoints:
+                {"name", "description", "lat", "lon", "osm_id"}
+                Waypoints ohne Namen fallen raus. osm_id ist hier der stabile Schlüssel gpx/<hash>.
+        Nur neue oder geänderte GPX (Pfad, mtime, size) werden geparsed, ab zwei Dateien im ProcessPool.
+        '''
+        gpx_file_names = find_gpx_files(gpx_dir_or_glob)
+        if len(gpx_file_names) == 0:
+            error_message("gpx_04", True)
+
+        if cache_file_name == None:
+            cache_file_name = IchSelbst().path_name_without_suffix + "_gpx_cache.json"
+        cache = load_gpx_cache(cache_file_name)
+
+        keys = {}
+        to_parse = []
+        for gpx_file_name in gpx_file_names:
+            keys[gpx_file_name] = gpx_cache_key(gpx_file_name)
+            if cache.get(gpx_file_name, {}).get("key") != keys[gpx_file_name]:
+                to_parse.append(gpx_file_name)
+
+        if len(to_parse) > 1:
+            with ProcessPoolExecutor() as pool:
+                results = list(pool.map(read_gpx_waypoints, to_parse))
+        else:                                                               # One file: starting a pool costs more than parsing it
+            results = [read_gpx_waypoints(gpx_file_name) for gpx_file_name in to_parse]
+
+        bad_files = []
+        for gpx_file_name, waypoints, err in results:
+            if err == None:
+                cache[gpx_file_name] = {"key": keys[gpx_file_name], "waypoints": waypoints}
+            else:
+                cache.pop(gpx_file_name, None)
+                bad_files.append(gpx_file_name)
+                print("GPX not readable: " + gpx_file_name + " -> " + err)
+        if len(to_parse) > 0:
+            save_gpx_cache(cache_file_name, cache)
+        if len(bad_files) > 0:
+            error_message("gpx_05", False)
+
+        return merge_waypoints([cache[gpx_file_name]["waypoints"] for gpx_file_name in gpx_file_names if gpx_file_name not in bad_files])
+
+# ------------------------------------------------------------------------------------------
+#  ____        _       _         ____ ______  __
+# | __ )  __ _| |_ ___| |__     / ___|  _ \ \/ /
+# |  _ \ / _` | __/ __| '_ \   | |  _| |_) \  / 
+# | |_) | (_| | || (__| | | |  | |_| |  __//  \ 
+# |____/ \__,_|\__\___|_| |_|___\____|_|  /_/\_\
+#                         |_____|              
+# ------------------------------------------------------------------------------------------
+GPX_CACHE_VERSION = 2                                                       # Bump whenever read_gpx_waypoints changes its output
+
+def find_gpx_files(gpx_dir_or_glob):
+    ''' File, directory or glob pattern -> sorted list of absolute GPX file names '''
+    if os.path.isfile(gpx_dir_or_glob):
+        if Path(gpx_dir_or_glob).suffix.lower() != '.gpx':
+            return []
+        return [os.path.abspath(gpx_dir_or_glob)]
+    if os.path.isdir(gpx_dir_or_glob):
+        gpx_dir_or_glob = os.path.join(glob.escape(gpx_dir_or_glob), "*.gpx")
+    gpx_file_names = [os.path.abspath(f) for f in glob.glob(gpx_dir_or_glob) if Path(f).suffix.lower() == '.gpx']
+    return sorted(set(gpx_file_names))
+
+def gpx_cache_key(gpx_file_name):
+    ''' A GPX is unchanged as long as mtime and size are the same. '''
+    stat = os.stat(gpx_file_name)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def load_gpx_cache(cache_file_name):
+    ''' If exists and of the current version: Load the parse cache. Otherwise start with an empty one. '''
+    try:
+        with open(cache_file_name, encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("version") != GPX_CACHE_VERSION or not isinstance(cache.get("files"), dict):
+        return {}
+    return cache["files"]
+
+def save_gpx_cache(cache_file_name, cache):
+    ''' Drop entries of deleted or moved GPX, then write via temp file so an interrupted run can't truncate the cache. '''
+    cache = {gpx_file_name: entry for gpx_file_name, entry in cache.items() if os.path.isfile(gpx_file_name)}
+    tmp_file_name = cache_file_name + ".tmp"
+    with open(tmp_file_name, "w", encoding='utf-8') as f:
+        json.dump({"version": GPX_CACHE_VERSION, "files": cache}, f, ensure_ascii=False)
+    os.replace(tmp_file_name, cache_file_name)
+
+def waypoint_key(name, lat, lon):
+    ''' Stable key for a waypoint without OSM id: same name at the same position -> same key. '''
+    text = name + "|" + format(lat, ".6f") + "|" + format(lon, ".6f")
+    return "gpx/" + hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+def read_gpx_waypoints(gpx_file_name):
+    '''
+    Runs in the ProcessPool - no Tk error windows in here.
+    Return (file name, waypoints as list of dict, None) or (file name, None, error text).
+    The error goes back as text: gpxpy exceptions can't be pickled back from the worker.
+    '''
+    try:
+        with open(gpx_file_name, 'r', encoding='utf-8') as gpx_file:
+            gpx = gpxpy.parse(gpx_file.read())
+    except Exception as err:
+        return gpx_file_name, None, str(err)
+    waypoints = []
+    for wpt in gpx.waypoints:
+        if wpt.name:                                                        # make_waypoints drops NoName as well
+            waypoints.append({"name": wpt.name, "description": wpt.description or '', "lat": wpt.latitude, "lon": wpt.longitude,
+                              "osm_id": waypoint_key(wpt.name, wpt.latitude, wpt.longitude)})
+    return gpx_file_name, waypoints, None
+
+def merge_waypoints(waypoint_lists):
+    ''' Merge lists of waypoints. Same key (name at the same position) is only taken once. '''
+    merged = []
+    seen = set()
+    for waypoints in waypoint_lists:
+        for wpt in waypoints:
+            if wpt["osm_id"] not in seen:
+                seen.add(wpt["osm_id"])
+                merged.append(wpt)
+    return merged
+
 # ------------------------------------------------------------------------------------------
 #  _____ _ _          _                     _ _ _             
 # |  ___(_) | ___    | |__   __ _ _ __   __| | (_)_ __   __ _ 